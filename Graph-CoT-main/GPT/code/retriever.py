@@ -3,6 +3,7 @@ import os
 import sys
 import json
 import pickle
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import nullcontext
 from typing import Dict, List
 import logging
@@ -24,7 +25,10 @@ logger = logging.getLogger(__name__)
 
 from IPython import embed
 
-from bs4 import BeautifulSoup
+# 预编译正则，clean_html 每个标题都要调用一次
+_TAG_RE = re.compile(r'<[^>]+>')
+_PARTIAL_OPEN = re.compile(r'<[^>]*$')   # 不完整的开始标签
+_PARTIAL_CLOSE = re.compile(r'^[^<]*>')  # 不完整的结束标签
 
 
 def clean_html(text):
@@ -32,21 +36,84 @@ def clean_html(text):
     if not isinstance(text, str):
         return str(text) if text is not None else ""
 
-    # 处理不完整的HTML标签
-    text = re.sub(r'<[^>]*$', '', text)  # 移除不完整的开始标签
-    text = re.sub(r'^[^<]*>', '', text)  # 移除不完整的结束标签
+    # 快速路径：完全不含标签的字符串直接返回，不走正则
+    if '<' not in text and '>' not in text:
+        cleaned_text = text.strip()
+        return cleaned_text if cleaned_text else "No title"
 
-    # 使用BeautifulSoup清理完整的HTML标签
-    soup = BeautifulSoup(text, "html.parser")
-    cleaned_text = soup.get_text().strip()
+    # 处理不完整的HTML标签
+    text = _PARTIAL_OPEN.sub('', text)
+    text = _PARTIAL_CLOSE.sub('', text)
 
-    # 如果清理后为空，返回原始文本（去除HTML标签）
-    if not cleaned_text:
-        cleaned_text = re.sub(r'<[^>]*>', '', text).strip()
+    # 去除完整的HTML标签
+    cleaned_text = _TAG_RE.sub('', text).strip()
 
     return cleaned_text if cleaned_text else "No title"
 
 
+# 按值类型分发的特征格式化函数（type() + dict 查表比 isinstance 链快）
+def _fmt_str(k, vv):
+    if vv.strip():  # 只有非空字符串才添加
+        return f"{k}: {vv}. "
+    return None
+
+
+def _fmt_num(k, vv):
+    if not math.isnan(vv):
+        return f"{k}: {str(vv)}. "
+    return None
+
+
+def _fmt_list(k, vv):
+    if vv:
+        return f"{k}: {', '.join(str(x) for x in vv)}. "
+    return None
+
+
+def _fmt_other(k, vv):
+    return None
+
+
+_FEATURE_FORMATTERS = {str: _fmt_str, int: _fmt_num, float: _fmt_num, list: _fmt_list}
+
+
+# linearize_feature 的分发表：空值要落成 "No xxx" 占位，与 process_graph 的跳过语义不同
+def _lin_str(k, val):
+    if val.strip():  # 非空字符串
+        return f"{k}: {val}. "
+    return f"{k}: No {k}. "
+
+
+def _lin_num(k, val):
+    if not math.isnan(val):
+        return f"{k}: {str(val)}. "
+    return f"{k}: No {k}. "
+
+
+def _lin_list(k, val):
+    if val:  # 非空列表
+        return f"{k}: {', '.join(str(x) for x in val)}. "
+    return f"{k}: No {k}. "
+
+
+def _lin_other(k, val):
+    return f"{k}: {str(val)}. "
+
+
+_LINEARIZE_FORMATTERS = {str: _lin_str, int: _lin_num, float: _lin_num, list: _lin_list}
+
+
+def load_graph(graph_dir):
+    """加载图 JSON；优先 orjson（SIMD 解析，大文件上约 3-5x 于 stdlib json）"""
+    try:
+        import orjson
+    except ImportError:
+        with open(graph_dir) as f:
+            return json.load(f)
+    with open(graph_dir, 'rb') as f:
+        return orjson.loads(f.read())
+
+
 NODE_TEXT_KEYS = {'maple': {'paper': ['title'], 'author': ['name'], 'venue': ['name']},
                   'amazon': {'item': ['title'], 'brand': ['name']},
                   'biomedical': {'Anatomy': ['name'], 'Biological_Process': ['name'], 'Cellular_Component': ['name'],
@@ -105,6 +172,51 @@ FEATURE_NODE_TYPE = {'maple': {'paper': ['title'], 'author': ['name'], 'venue':
                      }
 
 
+class _OnnxEncoder:
+    """ONNX Runtime 动态 int8 量化编码器，暴露与 SentenceTransformer 兼容的 encode()
+
+    CPU 上 FP32 的 BERT 前向是单条查询的主要延迟来源；int8 + VNNI 指令
+    大约能拿到 2-4x 的吞吐。导出和量化只做一次，产物缓存在 cache_dir 下。
+    """
+
+    def __init__(self, model_name, cache_dir):
+        from transformers import AutoTokenizer
+        from optimum.onnxruntime import ORTModelForFeatureExtraction, ORTQuantizer
+        from optimum.onnxruntime.configuration import AutoQuantizationConfig
+
+        os.makedirs(cache_dir, exist_ok=True)
+        quant_dir = os.path.join(cache_dir, 'onnx-int8-' + model_name.split('/')[-1])
+        if not os.path.isdir(quant_dir):
+            logger.info(f"Exporting {model_name} to quantized ONNX at {quant_dir}")
+            model = ORTModelForFeatureExtraction.from_pretrained(model_name, export=True)
+            quantizer = ORTQuantizer.from_pretrained(model)
+            qconfig = AutoQuantizationConfig.avx512_vnni(is_static=False)
+            quantizer.quantize(save_dir=quant_dir, quantization_config=qconfig)
+
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+        self.model = ORTModelForFeatureExtraction.from_pretrained(quant_dir)
+
+    def encode(self, sentences, batch_size=64, convert_to_numpy=True, **kwargs):
+        single = isinstance(sentences, str)
+        if single:
+            sentences = [sentences]
+
+        outs = []
+        for i in range(0, len(sentences), batch_size):
+            enc = self.tokenizer(sentences[i:i + batch_size], padding=True,
+                                 truncation=True, max_length=512, return_tensors='pt')
+            with torch.inference_mode():
+                hidden = self.model(**enc).last_hidden_state
+            # mean pooling + L2 归一化，对齐 SBERT 的池化方式
+            mask = enc['attention_mask'].unsqueeze(-1).float()
+            emb = (hidden * mask).sum(1) / mask.sum(1).clamp(min=1e-9)
+            emb = torch.nn.functional.normalize(emb, p=2, dim=1)
+            outs.append(emb.cpu().numpy())
+
+        embs = np.concatenate(outs)
+        return embs[0] if single else embs
+
+
 class Retriever:
 
     def __init__(self, args, graph, cache=True, cache_dir=None):
@@ -114,11 +226,53 @@ class Retriever:
         self.use_gpu = args.faiss_gpu
         self.node_text_keys = args.node_text_keys
         self.model_name = args.embedder_name
-        self.model = sentence_transformers.SentenceTransformer(args.embedder_name)
+        if getattr(args, 'embedder_backend', 'sbert') == 'onnx':
+            try:
+                self.model = _OnnxEncoder(args.embedder_name, args.embed_cache_dir)
+            except Exception as e:
+                logger.warning(f"ONNX backend unavailable ({e}), falling back to SentenceTransformer")
+                self.model = sentence_transformers.SentenceTransformer(args.embedder_name)
+        else:
+            self.model = sentence_transformers.SentenceTransformer(args.embedder_name)
+
+        # PyTorch 2.x：可选编译 transformer 前向，消掉 eager 的 Python 分发开销
+        if getattr(args, 'compile_encoder', False) and hasattr(torch, 'compile') \
+                and isinstance(self.model, sentence_transformers.SentenceTransformer):
+            try:
+                first = self.model._first_module()
+                first.auto_model = torch.compile(first.auto_model, mode='reduce-overhead', dynamic=True)
+            except Exception as e:
+                logger.warning(f"torch.compile failed ({e}), keeping eager encoder")
+        if torch.cuda.is_available():
+            # Ampere+ 上 TF32 matmul 明显更快，对召回的精度影响可忽略
+            torch.backends.cuda.matmul.allow_tf32 = True
+            torch.set_float32_matmul_precision('high')
         self.graph = graph
         self.cache = args.embed_cache
         self.cache_dir = args.embed_cache_dir
 
+        self.encode_batch_size = getattr(args, 'encode_batch_size', 256)
+
+        # 索引结构与速度/召回旋钮（不设置时按规模自动选择）
+        self.index_spec = getattr(args, 'index_spec', None)
+        self.index_nprobe = getattr(args, 'nprobe', 32)
+        self.index_ef_search = getattr(args, 'ef_search', 64)
+
+        # 同一个邻居节点会被反复线性化，缓存 (node_type, node_indice) -> 文本
+        self._feature_cache = {}
+
+        # 检索结果落盘改为可选：调用方传入带 write(dict) 的缓冲 writer 才会写
+        self._result_writer = getattr(args, 'result_writer', None)
+
+        # 查询向量缓存：推理循环里同一查询经常重复出现，命中即省一次编码前向
+        self._query_embed_cache = {}
+
+        # GPU 资源惰性创建并跨 reset 复用
+        self._gpu_res = None
+
+        # GPU 检索时复用的锁页（pinned）查询缓冲，省掉每次 H2D 前的 pageable 拷贝
+        self._query_staging = None
+
         self.reset()
 
     def reset(self):
@@ -129,47 +283,61 @@ class Retriever:
 
         docs, ids, meta_type = self.process_graph()
         save_model_name = self.model_name.split('/')[-1]
+        meta_path = os.path.join(self.cache_dir, f'cache-{save_model_name}.pkl')
+        index_path = os.path.join(self.cache_dir, f'index-{save_model_name}.faiss')
 
-        if self.cache and os.path.isfile(os.path.join(self.cache_dir, f'cache-{save_model_name}.pkl')):
-            embeds, self.doc_lookup, self.doc_type = pickle.load(
-                open(os.path.join(self.cache_dir, f'cache-{save_model_name}.pkl'), 'rb'))
+        if self.cache and os.path.isfile(meta_path) and os.path.isfile(index_path):
+            self.doc_lookup, self.doc_type = pickle.load(open(meta_path, 'rb'))
             assert self.doc_lookup == ids
             assert self.doc_type == meta_type
+            # mmap 直接加载建好的索引，跳过重新 add 的 O(N*d) 内存拷贝
+            logger.info(f"Loading cached index from {index_path}")
+            self.index = faiss.read_index(index_path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+            self._tune_index()
+            if self.use_gpu:
+                self._move_index_to_gpu()
         else:
             embeds = self.multi_gpu_infer(docs)
             self.doc_lookup = ids
             self.doc_type = meta_type
-            pickle.dump([embeds, ids, meta_type],
-                        open(os.path.join(self.cache_dir, f'cache-{save_model_name}.pkl'), 'wb'))
+            pickle.dump([ids, meta_type], open(meta_path, 'wb'))
+            self.init_index_and_add(embeds, save_path=index_path if self.cache else None)
 
-        self.init_index_and_add(embeds)
+        # 一次性转成 numpy 数组，查询时只做 O(topk) 的花式索引
+        self._doc_lookup_np = np.asarray(self.doc_lookup, dtype=object)
+        self._doc_type_np = np.asarray(self.doc_type, dtype=object)
 
     def process_graph(self):
         docs = []
         ids = []
         meta_type = []
 
+        # 绑定到局部名，避免热循环里反复做属性/哈希查找
+        docs_append = docs.append
+        ids_append = ids.append
+        meta_append = meta_type.append
+        formatters = _FEATURE_FORMATTERS
+
         for node_type_key in self.graph.keys():
             node_type = node_type_key.split('_nodes')[0]
             logger.info(f'loading text for {node_type}')
-            for nid in tqdm(self.graph[node_type_key]):
-                tmp_string = ''
+            nodes = self.graph[node_type_key]
+            keys = self.node_text_keys[node_type]
+            for nid, node in tqdm(nodes.items()):
+                parts = []
                 try:
-                    for k in self.node_text_keys[node_type]:
-                        if k in self.graph[node_type_key][nid]['features']:
-                            vv = self.graph[node_type_key][nid]['features'][k]
-
-                            # 改进的值处理
-                            if isinstance(vv, str):
-                                if k == 'title':
-                                    vv = clean_html(vv)
-                                if vv.strip():  # 只有非空字符串才添加
-                                    tmp_string += f"{k}: {vv}. "
-                            elif isinstance(vv, (int, float)) and not math.isnan(vv):
-                                tmp_string += f"{k}: {str(vv)}. "
-                            elif isinstance(vv, list) and vv:
-                                tmp_string += f"{k}: {', '.join(str(x) for x in vv)}. "
-
+                    feats = node['features']
+                    for k in keys:
+                        vv = feats.get(k)
+                        if vv is None:
+                            continue
+                        if k == 'title' and type(vv) is str:
+                            vv = clean_html(vv)
+                        frag = formatters.get(type(vv), _fmt_other)(k, vv)
+                        if frag:
+                            parts.append(frag)
+
+                    tmp_string = ''.join(parts)
                     # 如果没有有效内容，添加基本信息
                     if not tmp_string.strip():
                         tmp_string = f"Node ID: {nid}. Type: {node_type}. "
@@ -178,9 +346,9 @@ class Retriever:
                     logger.warning(f"Error processing node {nid}: {e}")
                     tmp_string = f"Node ID: {nid}. Type: {node_type}. "
 
-                docs.append(tmp_string)
-                ids.append(nid)
-                meta_type.append(node_type)
+                docs_append(tmp_string)
+                ids_append(nid)
+                meta_append(node_type)
 
                 # Debug: 检查生成的文本
                 if len(tmp_string) < 20:
@@ -190,53 +358,164 @@ class Retriever:
         return docs, ids, meta_type
 
     def multi_gpu_infer(self, docs):
-        pool = self.model.start_multi_process_pool()
-        embeds = self.model.encode_multi_process(docs, pool)
+        # 先去重：图里大量节点文本完全相同（"No title"、常见品牌名等），重复编码纯属浪费
+        uniq_map = {}
+        inverse = np.empty(len(docs), dtype=np.int64)
+        for i, doc in enumerate(docs):
+            inverse[i] = uniq_map.setdefault(doc, len(uniq_map))
+        unique_docs = list(uniq_map)
+
+        if len(unique_docs) < len(docs):
+            logger.info(f"Encoding {len(unique_docs)} unique docs out of {len(docs)}")
+
+        unique_embs = self._encode_corpus(unique_docs)
+        return unique_embs[inverse]
+
+    def _encode_corpus(self, docs):
+        ngpu = torch.cuda.device_count()
+
+        if ngpu > 1 and hasattr(self.model, 'start_multi_process_pool'):
+            # 多卡才值得起子进程池；按卡数切块减少调度开销
+            pool = self.model.start_multi_process_pool()
+            embeds = self.model.encode_multi_process(
+                docs, pool, chunk_size=max(1, len(docs) // (ngpu * 4)))
+            self.model.stop_multi_process_pool(pool)
+            return embeds
+
+        if ngpu == 0:
+            torch.set_num_threads(os.cpu_count())
+
+        # 单卡/CPU：直接批量编码。先按长度排序减小 batch 内 padding 浪费，编码后恢复原顺序
+        order = np.argsort([len(d) for d in docs])
+        with torch.inference_mode():
+            sorted_embs = self.model.encode([docs[i] for i in order],
+                                            batch_size=self.encode_batch_size,
+                                            show_progress_bar=True,
+                                            device='cuda' if ngpu == 1 else 'cpu',
+                                            convert_to_numpy=True)
+        embeds = np.empty_like(sorted_embs)
+        embeds[order] = sorted_embs
         return embeds
 
-    def _initialize_faiss_index(self, dim: int):
+    def _initialize_faiss_index(self, dim: int, n_vectors: int = 0):
         self.index = None
-        cpu_index = faiss.IndexFlatIP(dim)
+        spec = self.index_spec
+        if spec is None:
+            # 小图用 HNSW（log 级搜索）；大图用 IVF + fp16 标量量化（省一半内存，SIMD 距离核）
+            spec = 'HNSW32' if n_vectors < 1_000_000 else 'IVF1024,SQfp16'
+        if spec == 'Flat':
+            cpu_index = faiss.IndexFlatIP(dim)
+        else:
+            cpu_index = faiss.index_factory(dim, spec, faiss.METRIC_INNER_PRODUCT)
         self.index = cpu_index
 
+    def _tune_index(self):
+        """设置查询期的速度/召回参数（nprobe / efSearch）"""
+        if hasattr(self.index, 'nprobe'):
+            self.index.nprobe = self.index_nprobe
+        if hasattr(self.index, 'hnsw'):
+            self.index.hnsw.efSearch = self.index_ef_search
+
     def _move_index_to_gpu(self):
         logger.info("Moving index to GPU")
-        ngpu = faiss.get_num_gpus()
-        gpu_resources = []
-        for i in range(ngpu):
-            res = faiss.StandardGpuResources()
-            gpu_resources.append(res)
+        if self._gpu_res is None:
+            # 每卡资源只建一次并复用；压低临时显存池，避免默认的大块 cudaMalloc
+            self._gpu_res = [faiss.StandardGpuResources() for _ in range(faiss.get_num_gpus())]
+            for res in self._gpu_res:
+                res.setTempMemory(256 * 1024 * 1024)
         co = faiss.GpuMultipleClonerOptions()
         co.shard = True
         co.usePrecomputed = False
-        vres = faiss.GpuResourcesVector()
-        vdev = faiss.Int32Vector()
-        for i in range(0, ngpu):
-            vdev.push_back(i)
-            vres.push_back(gpu_resources[i])
-        self.index = faiss.index_cpu_to_gpu_multiple(vres, vdev, self.index, co)
-
-    def init_index_and_add(self, embeds):
+        co.useFloat16 = True  # 半精度存储：显存减半，IP 距离核吞吐更高
+        self.index = faiss.index_cpu_to_gpu_multiple_py(self._gpu_res, self.index, co)
+
+    def init_index_and_add(self, embeds, save_path=None):
         logger.info("Initialize the index...")
         dim = embeds.shape[1]
-        self._initialize_faiss_index(dim)
+        self._initialize_faiss_index(dim, n_vectors=len(embeds))
+
+        if not self.index.is_trained:
+            # IVF 类索引先在子样本上训练聚类中心
+            train_n = min(len(embeds), 100_000)
+            sample = embeds[np.random.choice(len(embeds), train_n, replace=False)]
+            self.index.train(sample)
+
         self.index.add(embeds)
+        self._tune_index()
+
+        # 趁索引还在 CPU 上时落盘，下次启动 read_index 即可复用
+        if save_path is not None:
+            faiss.write_index(self.index, save_path)
 
         if self.use_gpu:
             self._move_index_to_gpu()
 
     def search_single(self, query, hop=1, topk=10):
-        if self.index is None:
-            raise ValueError("Index is not initialized")
+        return self.search_batch([query], hop=hop, topk=topk)[0]
 
-        query_embed = self.model.encode(query, show_progress_bar=False)
+    def search_batch(self, queries, hop=1, topk=10, chunk=256):
+        """批量检索：N 个查询只做一次编码前向和一次 FAISS search
 
-        D, I = self.index.search(query_embed[None, :], topk)
+        超过 chunk 条时按块流水线：编码第 k+1 块的同时检索第 k 块。
+        编码器和 FAISS 在各自的 C/CUDA 后端里都会释放 GIL，重叠是真实的。
+        """
+        if self.index is None:
+            raise ValueError("Index is not initialized")
 
+        if len(queries) <= chunk:
+            return self._search_block(queries, self._encode_queries(queries), hop, topk)
+
+        contexts = []
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            next_embs = pool.submit(self._encode_queries, queries[:chunk])
+            for start in range(0, len(queries), chunk):
+                embs = next_embs.result()
+                if start + chunk < len(queries):
+                    next_embs = pool.submit(self._encode_queries,
+                                            queries[start + chunk:start + 2 * chunk])
+                contexts.extend(self._search_block(queries[start:start + chunk], embs, hop, topk))
+        return contexts
+
+    def _search_block(self, queries, query_embeds, hop, topk):
+        if self.use_gpu and torch.cuda.is_available():
+            query_embeds = self._stage_queries(query_embeds)
+
+        D, I = self.index.search(query_embeds, topk)
+
+        return [self._build_context(query, scores, indices, hop)
+                for query, scores, indices in zip(queries, D, I)]
+
+    def _encode_queries(self, queries, max_cache=4096):
+        cache = self._query_embed_cache
+        misses = list(dict.fromkeys(q for q in queries if q not in cache))
+        if misses:
+            with torch.inference_mode():
+                embs = self.model.encode(misses, batch_size=64, show_progress_bar=False,
+                                         convert_to_numpy=True, normalize_embeddings=False)
+            for q, emb in zip(misses, embs):
+                cache[q] = emb
+            # 简单 FIFO 上限，防止长任务里缓存无界增长
+            while len(cache) > max_cache:
+                cache.pop(next(iter(cache)))
+        return np.stack([cache[q] for q in queries])
+
+    def _stage_queries(self, query_embeds, min_rows=64):
+        """把查询向量搬进复用的锁页缓冲，让 FAISS 的 H2D 拷贝走异步 DMA 路径"""
+        batch, dim = query_embeds.shape
+        buf = self._query_staging
+        if buf is None or buf.shape[0] < batch or buf.shape[1] != dim:
+            self._query_staging = torch.empty((max(batch, min_rows), dim),
+                                              dtype=torch.float32, pin_memory=True)
+            buf = self._query_staging
+        staged = buf[:batch]
+        staged.copy_(torch.from_numpy(np.ascontiguousarray(query_embeds, dtype=np.float32)))
+        return staged.numpy()
+
+    def _build_context(self, query, scores, indices, hop):
         # 获取所有topk结果的信息
-        top_indices = np.array(self.doc_lookup)[I].tolist()[0]
-        top_types = np.array(self.doc_type)[I].tolist()[0]
-        top_scores = D.tolist()[0]
+        top_indices = self._doc_lookup_np[indices].tolist()
+        top_types = self._doc_type_np[indices].tolist()
+        top_scores = scores.tolist()
 
         logger.info(f"Top {len(top_indices)} results for query '{query}':")
         for i, (idx, node_type, score) in enumerate(zip(top_indices, top_types, top_scores)):
@@ -259,91 +538,78 @@ class Retriever:
             logger.error(f"Error generating context: {e}")
             context = f"Error: Could not generate context for node {original_indice} of type {original_type}"
 
-        # 保存结果
-        result = {
-            'query': query,
-            'context': context,
-            'top_matches': [
-                {'node_id': idx, 'node_type': nt, 'score': float(score)}
-                for idx, nt, score in zip(top_indices[:5], top_types[:5], top_scores[:5])
-            ]
-        }
-
-        result_filename = '/Users/yehaoran/Desktop/KGAgentEcno/Graph-CoT-main/GPT/results/GPT_retriever_results.json'
-        with open(result_filename, 'w', encoding='utf-8') as f:
-            json.dump(result, f, indent=4, ensure_ascii=False)
+        # 保存结果（可选，避免每次查询都同步写盘）
+        if self._result_writer is not None:
+            self._result_writer.write({
+                'query': query,
+                'context': context,
+                'top_matches': [
+                    {'node_id': idx, 'node_type': nt, 'score': float(score)}
+                    for idx, nt, score in zip(top_indices[:5], top_types[:5], top_scores[:5])
+                ]
+            })
 
         return context
 
     def linearize_feature(self, node_type, node_indice):
         """改进的特征线性化方法"""
-        text = ''
+        cache_key = (node_type, node_indice)
+        cached = self._feature_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+        parts = []
         try:
             node_features = self.graph[f'{node_type}_nodes'][node_indice]['features']
+            feature_keys = FEATURE_NODE_TYPE[self.dataset][node_type]
+            formatters = _LINEARIZE_FORMATTERS
 
             for f_name in node_features:
-                if f_name in FEATURE_NODE_TYPE[self.dataset][node_type]:
+                if f_name in feature_keys:
                     val = node_features[f_name]
 
                     # 特殊处理title字段的HTML
-                    if f_name == 'title' and isinstance(val, str):
+                    if f_name == 'title' and type(val) is str:
                         val = clean_html(val)
 
-                    # 处理空值
-                    if isinstance(val, str):
-                        if val.strip():  # 非空字符串
-                            text += f"{f_name}: {val}. "
-                        else:
-                            text += f"{f_name}: No {f_name}. "
-                    elif isinstance(val, (int, float)):
-                        if not math.isnan(val):
-                            text += f"{f_name}: {str(val)}. "
-                        else:
-                            text += f"{f_name}: No {f_name}. "
-                    elif isinstance(val, list):
-                        if val:  # 非空列表
-                            text += f"{f_name}: {', '.join(str(x) for x in val)}. "
-                        else:
-                            text += f"{f_name}: No {f_name}. "
-                    else:
-                        text += f"{f_name}: {str(val)}. "
+                    parts.append(formatters.get(type(val), _lin_other)(f_name, val))
+
+            text = ''.join(parts)
 
         except Exception as e:
             logger.error(f"Error linearizing features for {node_type} {node_indice}: {e}")
             text = f"Node {node_indice} of type {node_type}. "
 
+        self._feature_cache[cache_key] = text
         return text
 
     def zero_hop(self, node_type, node_indice):
-        context = 'Center node: '
-        context += self.linearize_feature(node_type, node_indice)
-        return context
+        return 'Center node: ' + self.linearize_feature(node_type, node_indice)
 
     def one_hop(self, node_type, node_indice, sample_n=20):
-        context = 'Center node: '
-        context += self.linearize_feature(node_type, node_indice)
+        parts = ['Center node: ', self.linearize_feature(node_type, node_indice)]
 
         try:
             node_neighbors = self.graph[f'{node_type}_nodes'][node_indice]['neighbors']
+            relation_map = RELATION_NODE_TYPE_MAP[self.dataset]
 
             for neighbor_type in node_neighbors:
-                context += f"\n{neighbor_type}: "
+                parts.append(f"\n{neighbor_type}: ")
                 neighbor_count = 0
 
                 for nid in node_neighbors[neighbor_type][:sample_n]:
                     try:
-                        if isinstance(RELATION_NODE_TYPE_MAP[self.dataset][neighbor_type], str):
-                            neighbor_node_type = RELATION_NODE_TYPE_MAP[self.dataset][neighbor_type]
-                            neighbor_features = self.linearize_feature(neighbor_node_type, nid)
+                        if isinstance(relation_map[neighbor_type], str):
+                            neighbor_features = self.linearize_feature(relation_map[neighbor_type], nid)
                             if neighbor_features.strip():
-                                context += neighbor_features
+                                parts.append(neighbor_features)
                                 neighbor_count += 1
-                        elif isinstance(RELATION_NODE_TYPE_MAP[self.dataset][neighbor_type], list):
-                            for ntt in RELATION_NODE_TYPE_MAP[self.dataset][neighbor_type]:
+                        elif isinstance(relation_map[neighbor_type], list):
+                            for ntt in relation_map[neighbor_type]:
                                 try:
                                     neighbor_features = self.linearize_feature(ntt, nid)
                                     if neighbor_features.strip():
-                                        context += neighbor_features
+                                        parts.append(neighbor_features)
                                         neighbor_count += 1
                                 except:
                                     continue
@@ -352,37 +618,45 @@ class Retriever:
                         continue
 
                 if neighbor_count == 0:
-                    context += "No valid neighbors found. "
+                    parts.append("No valid neighbors found. ")
 
         except Exception as e:
             logger.error(f"Error in one_hop for {node_type} {node_indice}: {e}")
-            context += f"Error accessing neighbors: {e}"
+            parts.append(f"Error accessing neighbors: {e}")
 
-        return context
+        return ''.join(parts)
 
     def two_hop(self, node_type, node_indice, sample_n=20):
-        context = 'Center node: '
-        context += self.linearize_feature(node_type, node_indice)
+        parts = ['Center node: ', self.linearize_feature(node_type, node_indice)]
 
         try:
             node_neighbors = self.graph[f'{node_type}_nodes'][node_indice]['neighbors']
+            relation_map = RELATION_NODE_TYPE_MAP[self.dataset]
 
             for neighbor_type in node_neighbors:
-                context += f"\n{neighbor_type}: "
+                parts.append(f"\n{neighbor_type}: ")
 
+                # 先把一跳邻居解析成 (节点类型, id) 队列，再逐个展开，避免递归里重复查表
+                frontier = []
+                ntt = relation_map.get(neighbor_type)
                 for nid in node_neighbors[neighbor_type][:sample_n]:
+                    if isinstance(ntt, str):
+                        frontier.append((ntt, nid))
+                    elif isinstance(ntt, list):
+                        frontier.extend((t, nid) for t in ntt)
+
+                for nt, nid in frontier:
                     try:
-                        neighbor_context = self.one_hop(neighbor_type, nid, sample_n=5)  # 减少二跳的采样
-                        context += f'[{neighbor_context}]. '
+                        parts.append(f'[{self.one_hop(nt, nid, sample_n=5)}]. ')  # 减少二跳的采样
                     except Exception as e:
                         logger.warning(f"Error in two_hop for neighbor {nid}: {e}")
                         continue
 
         except Exception as e:
             logger.error(f"Error in two_hop for {node_type} {node_indice}: {e}")
-            context += f"Error accessing two-hop neighbors: {e}"
+            parts.append(f"Error accessing two-hop neighbors: {e}")
 
-        return context
+        return ''.join(parts)
 
 
 if __name__ == '__main__':
@@ -398,7 +672,7 @@ if __name__ == '__main__':
     graph_dir = "/Users/yehaoran/Desktop/KGAgentEcno/Graph-CoT-main/data/processed_data/amazon/magazine_graph.json"
     query = "quantum physics and machine learning"
 
-    graph = json.load(open(graph_dir))
+    graph = load_graph(graph_dir)
     node_retriever = Retriever(args, graph)
 
     # 执行查询
@@ -5,7 +5,7 @@ import time
 import logging
 import jsonlines
 import argparse
-import requests  # 使用 requests 库替换 OpenAI 的客户端
+import aiohttp  # 异步 HTTP 客户端，替换同步的 requests
 
 from typing import List, Dict, Any
 import asyncio
@@ -53,8 +53,10 @@ def dispatch_deepseek_requests(
     # 正确的 DeepSeek Chat Completions 接口（不要带 /v1）
     url = "https://api.deepseek.com/chat/completions"
 
-    async_responses = []
-    for x in messages_list:
+    # 并发上限，避免触发 API 限流
+    semaphore = asyncio.Semaphore(20)
+
+    async def _one(session, x):
         payload = {
             "model": model,             # 例如 "deepseek-chat"
             "messages": x,
@@ -62,13 +64,18 @@ def dispatch_deepseek_requests(
             "max_tokens": max_tokens,
             "top_p": top_p
         }
-        # 按你原有的“收集再统一 .json()”的同步风格，不改逻辑
-        async_responses.append(
-            requests.post(url, json=payload, headers=headers)
-        )
+        async with semaphore:
+            async with session.post(url, json=payload, headers=headers) as response:
+                return await response.json()
+
+    async def _all():
+        # 共享一个 keep-alive 连接池，所有请求真正并发发出
+        connector = aiohttp.TCPConnector(limit=32)
+        async with aiohttp.ClientSession(connector=connector) as session:
+            return await asyncio.gather(*[_one(session, x) for x in messages_list])
 
-    # 保持你原有的返回风格（不加额外容错，尽量不改逻辑）
-    return [response.json() for response in async_responses]
+    # 返回形状不变：解析后的 JSON dict 列表
+    return asyncio.run(_all())
 
 
 def main():
@@ -112,7 +119,6 @@ def main():
                 max_tokens=2048,
                 top_p=1.0,
             )
-            time.sleep(5)  # 请求间隔 5 秒（你要求）
         except:
             print("rate limit exceeded, sleep for 5 seconds")
             time.sleep(5)  # Rate Limit 也改成 5 秒（你要求）
@@ -1,64 +1,74 @@
+import asyncio
 import json
 import evaluate
 import argparse
 import os
-from openai import OpenAI
+from concurrent.futures import ThreadPoolExecutor
+from openai import AsyncOpenAI
 
 from IPython import embed
 
-parser = argparse.ArgumentParser("")
-parser.add_argument("--result_file", type=str, default="/Users/yehaoran/Desktop/KGAgentEcno/Graph-CoT-main/LLM/result/run_LLM_rag_results.json")
-parser.add_argument("--model", type=str, default="None")
-parser.add_argument("--openai_key", type=str, default="")
-args = parser.parse_args()
+# 指标只加载一次；evaluate.load 每次都要走磁盘/网络查找，数百 ms 一个
+_EM_METRIC = evaluate.load('exact_match')
+_BLEU_METRIC = evaluate.load('sacrebleu')
+_ROUGE_METRIC = evaluate.load('rouge')
 
 
 def compute_exact_match(predictions, references):
-    em_metric = evaluate.load('exact_match')
-    return em_metric.compute(predictions=predictions, references=references)
+    return _EM_METRIC.compute(predictions=predictions, references=references)
 
 
 def compute_bleu(predictions, references):
-    bleu_metric = evaluate.load('sacrebleu')
-    return bleu_metric.compute(predictions=predictions, references=references)
+    return _BLEU_METRIC.compute(predictions=predictions, references=references)
 
 
 def compute_rouge(predictions, references):
-    rouge_metric = evaluate.load('rouge')
-    return rouge_metric.compute(predictions=predictions, references=references)
+    return _ROUGE_METRIC.compute(predictions=predictions, references=references)
+
+
+def _parse_gpt_score(content):
+    """处理API返回结果，提取Yes/No"""
+    lowered = content.lower()
+    if 'yes' in lowered or 'correct' in lowered:
+        return 1
+    elif 'no' in lowered or 'incorrect' in lowered:
+        return 0
+    # 如果无法判断，打印返回内容并默认为0
+    print(f"Unexpected response: {content}")
+    return 0
 
 
 def GPT4score(predictions, references, questions):
-    client = OpenAI(
+    client = AsyncOpenAI(
         base_url="https://api.deepseek.com/v1",  # DeepSeek 的接口地址
         api_key="sk-dffc730848234fc3be92bf457ce88955"  # 你在 DeepSeek 平台申请的 key
     )
     # eval_prompt = "Please help me judge if the ground truth is inside the model prediction with string match.\nModel prediction: {} \nGround truth: {}. \nPlease answer Yes or No."
     eval_prompt = "Question:{} \nModel prediction: {} \nGround truth: {}. \nPlease help me judge if the model prediction is correct or not given the question and ground truth answer. Please use one word (Yes or No) to answer. Do not explain."
 
-    res = []
-    for pred, ref, question in zip(predictions, references, questions):
+    async def _score_one(sem, pred, ref, question):
         x = eval_prompt.format(question, pred, ref)
-        response = client.chat.completions.create(
-            model="deepseek-chat",
-            messages=[
-                {"role": "system", "content": "You are a generative language model evaluator."},
-                {"role": "user", "content": x},
-            ],
-            temperature=0.01,
-            top_p=1.0,
-        )
-        GPT_score = response.choices[0].message.content.strip()
-
-        # 处理API返回结果，提取Yes/No
-        if 'yes' in GPT_score.lower() or 'correct' in GPT_score.lower():
-            res.append(1)
-        elif 'no' in GPT_score.lower() or 'incorrect' in GPT_score.lower():
-            res.append(0)
-        else:
-            # 如果无法判断，打印返回内容并默认为0
-            print(f"Unexpected response: {GPT_score}")
-            res.append(0)
+        async with sem:
+            response = await client.chat.completions.create(
+                model="deepseek-chat",
+                messages=[
+                    {"role": "system", "content": "You are a generative language model evaluator."},
+                    {"role": "user", "content": x},
+                ],
+                temperature=0.01,
+                top_p=1.0,
+            )
+        return _parse_gpt_score(response.choices[0].message.content.strip())
+
+    async def _score_all():
+        # 最多 20 路并发，尊重 API 限流
+        sem = asyncio.Semaphore(20)
+        return await asyncio.gather(*[
+            _score_one(sem, pred, ref, question)
+            for pred, ref, question in zip(predictions, references, questions)
+        ])
+
+    res = asyncio.run(_score_all())
     return sum(res) / len(res)
 
 
@@ -104,16 +114,32 @@ def save_results(model_name, em_score, bleu_score, rouge_score, gpt4_score):
     return save_path
 
 
-results, preds, gts, questions = read_json(args.result_file)
-preds = [pred if pred != None else '' for pred in preds]
-em_score = compute_exact_match(preds, gts)
-bleu_score = compute_bleu(preds, gts)
-rouge_score = compute_rouge(preds, gts)
-gpt4_score = GPT4score(preds, gts, questions)
+def main():
+    parser = argparse.ArgumentParser("")
+    parser.add_argument("--result_file", type=str, default="/Users/yehaoran/Desktop/KGAgentEcno/Graph-CoT-main/LLM/result/run_LLM_rag_results.json")
+    parser.add_argument("--model", type=str, default="None")
+    parser.add_argument("--openai_key", type=str, default="")
+    args = parser.parse_args()
+
+    results, preds, gts, questions = read_json(args.result_file)
+    preds = [pred if pred != None else '' for pred in preds]
+    # 三个指标相互独立，且 C 后端会释放 GIL，可并行算
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        em_future = pool.submit(compute_exact_match, preds, gts)
+        bleu_future = pool.submit(compute_bleu, preds, gts)
+        rouge_future = pool.submit(compute_rouge, preds, gts)
+        em_score = em_future.result()
+        bleu_score = bleu_future.result()
+        rouge_score = rouge_future.result()
+    gpt4_score = GPT4score(preds, gts, questions)
+
+    # 打印结果（保持原有输出）
+    print(
+        f"{args.model} || EM: {em_score['exact_match']} | Bleu: {bleu_score['score']} | Rouge1: {rouge_score['rouge1']} | Rouge2: {rouge_score['rouge2']} | RougeL: {rouge_score['rougeL']} | RougeLSum: {rouge_score['rougeLsum']} | GPT4score: {gpt4_score}")
+
+    # 保存结果到文件
+    save_results(args.model, em_score, bleu_score, rouge_score, gpt4_score)
 
-# 打印结果（保持原有输出）
-print(
-    f"{args.model} || EM: {em_score['exact_match']} | Bleu: {bleu_score['score']} | Rouge1: {rouge_score['rouge1']} | Rouge2: {rouge_score['rouge2']} | RougeL: {rouge_score['rougeL']} | RougeLSum: {rouge_score['rougeLsum']} | GPT4score: {gpt4_score}")
 
-# 保存结果到文件
-save_results(args.model, em_score, bleu_score, rouge_score, gpt4_score)
\ No newline at end of file
+if __name__ == '__main__':
+    main()
\ No newline at end of file
@@ -1,9 +1,28 @@
+import functools
+import sys
 import networkx as nx
+import numpy as np
 from typing import Dict, List, Any, Optional, Tuple
+from collections import defaultdict
 import json
 import asyncio
 from datetime import datetime
 
+# 缺失属性哨兵，区分“键不存在”和“值为None”
+_MISSING = object()
+
+
+@functools.lru_cache(maxsize=256)
+def _make_matcher(keys: Tuple[str, ...]):
+    """按查询键形状生成专用匹配谓词，同形状查询直接复用"""
+    if not keys:
+        return lambda node_data, values: True
+    src = "lambda node_data, values: " + " and ".join(
+        f"node_data.get({key!r}, _MISSING) == values[{i}]"
+        for i, key in enumerate(keys)
+    )
+    return eval(src, {'_MISSING': _MISSING})
+
 class KnowledgeGraphInterface:
     """知识图谱接口"""
     
@@ -12,7 +31,30 @@ class KnowledgeGraphInterface:
         self.graph = nx.MultiDiGraph()
         self.entity_embeddings = {}
         self.relation_embeddings = {}
-        
+
+        # 实体嵌入存连续float32矩阵（SoA），按行号索引；
+        # 批量相似度由一次GEMV完成
+        self._embedding_dim = config.get('embedding_dim', 64)
+        self._entity_emb_matrix = np.empty((0, self._embedding_dim),
+                                           dtype=np.float32)
+        self._entity_id_to_row = {}
+
+        # 子图查询缓存：键为 (实体集, 关系集, 深度)，图变更时整体失效
+        self._subgraph_cache = {}
+        self._subgraph_cache_max = config.get('subgraph_cache_size', 256)
+        self.cache_hits = 0
+
+        # CSR 邻接（SoA）：热读路径用连续数组代替字典嵌套的指针追逐，
+        # 图变更后置脏，首次读取时惰性重建
+        self._csr_dirty = True
+        self._csr_indptr = None
+        self._csr_indices = None
+        self._csr_node_ids = None
+        self._csr_node_row = None
+
+        # 属性倒排索引：键→值→实体集合，等值搜索按posting list求交
+        self._prop_index = defaultdict(lambda: defaultdict(set))
+
         # 初始化基础知识图谱
         self._initialize_base_kg()
     
@@ -24,9 +66,10 @@ class KnowledgeGraphInterface:
         ]
         
         for entity_type in entity_types:
-            self.graph.add_node(f"entity_type_{entity_type}", 
-                              type='meta', 
-                              category='entity_type')
+            node_id = f"entity_type_{entity_type}"
+            attrs = {'type': 'meta', 'category': 'entity_type'}
+            self.graph.add_node(node_id, **attrs)
+            self._index_entity(node_id, attrs)
         
         # 添加基础关系类型
         relation_types = [
@@ -34,94 +77,211 @@ class KnowledgeGraphInterface:
         ]
         
         for relation_type in relation_types:
-            self.graph.add_node(f"relation_type_{relation_type}", 
-                              type='meta', 
-                              category='relation_type')
+            node_id = f"relation_type_{relation_type}"
+            attrs = {'type': 'meta', 'category': 'relation_type'}
+            self.graph.add_node(node_id, **attrs)
+            self._index_entity(node_id, attrs)
     
-    async def query_subgraph(self, entities: List[str], 
-                           relations: List[str], 
+    async def query_subgraph(self, entities: List[str],
+                           relations: List[str],
+                           max_depth: int = 3) -> Dict[str, Any]:
+        """查询子图（异步薄封装，内部走同步路径）"""
+        return self.query_subgraph_sync(entities, relations, max_depth)
+
+    def query_subgraph_sync(self, entities: List[str],
+                           relations: List[str],
                            max_depth: int = 3) -> Dict[str, Any]:
         """查询子图"""
+        # 连续任务常共享实体，先查缓存避免重复遍历
+        cache_key = (frozenset(entities), frozenset(relations), max_depth)
+        cached = self._subgraph_cache.get(cache_key)
+        if cached is not None:
+            self.cache_hits += 1
+            return cached
+
+        # 在图中的查询实体和成员集合只算一次，后续各阶段复用
+        graph = self.graph
+        entities_set = set(entities)
+        present = [e for e in entities if graph.has_node(e)]
+
         # 构建查询子图
         subgraph = {
-            'entities': {},
-            'relations': [],
+            # 查找相关实体
+            'entities': {e: dict(graph.nodes[e]) for e in present},
+            # 查找相关关系：一次推导收集实体间直接连边（邻居走CSR数组）
+            'relations': [
+                {
+                    'source': entity,
+                    'target': neighbor,
+                    'relation': data.get('relation', 'unknown'),
+                    'weight': data.get('weight', 1.0)
+                }
+                for entity in present
+                for neighbor in self._neighbors(entity)
+                if neighbor in entities_set
+                for data in (graph.get_edge_data(entity, neighbor) or {}).values()
+            ],
             'paths': []
         }
-        
-        # 查找相关实体
-        for entity in entities:
-            if self.graph.has_node(entity):
-                subgraph['entities'][entity] = dict(self.graph.nodes[entity])
-        
-        # 查找相关关系
-        for entity in entities:
-            if self.graph.has_node(entity):
-                # 查找直接连接
-                neighbors = list(self.graph.neighbors(entity))
-                for neighbor in neighbors:
-                    if neighbor in entities:
-                        edge_data = self.graph.get_edge_data(entity, neighbor)
-                        if edge_data:
-                            for key, data in edge_data.items():
-                                subgraph['relations'].append({
-                                    'source': entity,
-                                    'target': neighbor,
-                                    'relation': data.get('relation', 'unknown'),
-                                    'weight': data.get('weight', 1.0)
-                                })
-        
-        # 查找路径
-        if len(entities) >= 2:
-            for i in range(len(entities)):
-                for j in range(i+1, len(entities)):
+
+        # 查找路径：每对实体只取一条最短路径（双向BFS），
+        # 代替指数级的简单路径枚举；不在图中的实体直接跳过
+        if len(present) >= 2:
+            for i in range(len(present)):
+                for j in range(i+1, len(present)):
                     try:
-                        paths = list(nx.all_simple_paths(
-                            self.graph, 
-                            entities[i], 
-                            entities[j], 
-                            cutoff=max_depth
-                        ))
-                        subgraph['paths'].extend(paths)
+                        path = nx.bidirectional_shortest_path(
+                            self.graph, present[i], present[j]
+                        )
                     except nx.NetworkXNoPath:
-                        pass
-        
+                        continue
+                    if len(path) - 1 <= max_depth:
+                        subgraph['paths'].append(path)
+
+        # FIFO 淘汰最旧条目，限制缓存规模
+        if len(self._subgraph_cache) >= self._subgraph_cache_max:
+            self._subgraph_cache.pop(next(iter(self._subgraph_cache)))
+        self._subgraph_cache[cache_key] = subgraph
+
         return subgraph
-    
+
     async def add_entity(self, entity_id: str, entity_data: Dict[str, Any]):
-        """添加实体"""
-        self.graph.add_node(entity_id, **entity_data)
-    
-    async def add_relation(self, source: str, target: str, 
+        """添加实体（异步薄封装，内部走同步路径）"""
+        self.add_entities([(entity_id, entity_data)])
+
+    def add_entities(self, items: List[Tuple[str, Dict[str, Any]]]):
+        """批量添加实体：一次 add_nodes_from 调用，索引同批维护"""
+        # 驻留实体id：不同来源的同名id共享同一str对象，
+        # 后续邻接/索引字典查找走指针比较
+        items = [(sys.intern(entity_id), entity_data)
+                 for entity_id, entity_data in items]
+        self.graph.add_nodes_from(items)
+        for entity_id, entity_data in items:
+            self._index_entity(entity_id, entity_data)
+        self._subgraph_cache.clear()
+        self._csr_dirty = True
+
+    def _index_entity(self, entity_id: str, entity_data: Dict[str, Any]):
+        """把实体属性写入倒排索引，不可哈希的值跳过"""
+        prop_index = self._prop_index
+        for key, value in entity_data.items():
+            try:
+                prop_index[key][value].add(entity_id)
+            except TypeError:
+                pass
+
+    async def add_relation(self, source: str, target: str,
                           relation: str, properties: Dict[str, Any] = None):
-        """添加关系"""
-        properties = properties or {}
-        self.graph.add_edge(source, target, relation=relation, **properties)
+        """添加关系（异步薄封装，内部走同步路径）"""
+        self.add_relations([(source, target, relation, properties or {})])
+
+    def add_relations(self, triples: List[Tuple]):
+        """批量添加关系：元素为 (source, target, relation[, properties])"""
+        self.graph.add_edges_from(
+            (sys.intern(t[0]), sys.intern(t[1]),
+             dict({'relation': t[2]}, **(t[3] if len(t) > 3 else {})))
+            for t in triples
+        )
+        self._subgraph_cache.clear()
+        self._csr_dirty = True
+
+    def _build_csr(self):
+        """由当前图重建CSR邻接数组"""
+        nodes = list(self.graph.nodes())
+        row = {node: i for i, node in enumerate(nodes)}
+        indptr = np.zeros(len(nodes) + 1, dtype=np.int32)
+        indices = []
+        for i, node in enumerate(nodes):
+            for neighbor in self.graph.neighbors(node):
+                indices.append(row[neighbor])
+            indptr[i + 1] = len(indices)
+        self._csr_node_ids = nodes
+        self._csr_node_row = row
+        self._csr_indptr = indptr
+        self._csr_indices = np.asarray(indices, dtype=np.int32)
+        self._csr_dirty = False
+
+    def _neighbors(self, entity: str) -> List[str]:
+        """按CSR数组返回出边邻居，未知实体返回空列表"""
+        if self._csr_dirty:
+            self._build_csr()
+        row = self._csr_node_row.get(entity)
+        if row is None:
+            return []
+        node_ids = self._csr_node_ids
+        start, end = self._csr_indptr[row], self._csr_indptr[row + 1]
+        return [node_ids[i] for i in self._csr_indices[start:end]]
     
-    async def search_entities(self, query: Dict[str, Any]) -> List[Dict[str, Any]]:
+    def search_entities(self, query: Dict[str, Any]) -> List[Dict[str, Any]]:
         """搜索实体"""
-        results = []
-        
-        for node_id, node_data in self.graph.nodes(data=True):
-            match = True
+        # 等值查询走倒排索引：posting list 从小到大求交，
+        # 命中后按当前节点属性复核，避免属性更新后的陈旧命中
+        if query:
+            posting_lists = []
+            indexable = True
             for key, value in query.items():
-                if key not in node_data or node_data[key] != value:
-                    match = False
+                try:
+                    posting_lists.append(self._prop_index[key].get(value, set()))
+                except TypeError:
+                    indexable = False
                     break
-            
-            if match:
+            if indexable:
+                posting_lists.sort(key=len)
+                candidates = posting_lists[0].intersection(*posting_lists[1:])
+                results = []
+                for node_id in candidates:
+                    node_data = self.graph.nodes[node_id]
+                    if all(node_data.get(k) == v for k, v in query.items()):
+                        results.append({
+                            'id': node_id,
+                            'properties': dict(node_data)
+                        })
+                return results
+
+        # 回退：空查询或不可哈希的查询值时线性扫描，
+        # 匹配逻辑按查询形状展开成固定比较，循环内不再迭代query
+        keys = tuple(sorted(query))
+        matcher = _make_matcher(keys)
+        values = tuple(query[key] for key in keys)
+        results = []
+
+        for node_id, node_data in self.graph.nodes(data=True):
+            if matcher(node_data, values):
                 results.append({
                     'id': node_id,
                     'properties': dict(node_data)
                 })
-        
+
         return results
     
-    async def get_entity_embedding(self, entity_id: str) -> Optional[List[float]]:
-        """获取实体嵌入"""
+    def add_entity_embedding(self, entity_id: str, vector):
+        """登记实体嵌入；矩阵容量不足时倍增扩容，避免逐条realloc"""
+        row = self._entity_id_to_row.get(entity_id)
+        if row is None:
+            row = len(self._entity_id_to_row)
+            if row >= self._entity_emb_matrix.shape[0]:
+                new_cap = max(16, self._entity_emb_matrix.shape[0] * 2)
+                grown = np.empty((new_cap, self._embedding_dim),
+                                 dtype=np.float32)
+                grown[:row] = self._entity_emb_matrix[:row]
+                self._entity_emb_matrix = grown
+            self._entity_id_to_row[entity_id] = row
+        self._entity_emb_matrix[row] = np.asarray(vector, dtype=np.float32)
+
+    def get_entity_embedding(self, entity_id: str) -> Optional[np.ndarray]:
+        """获取实体嵌入（矩阵行的零拷贝视图）"""
+        row = self._entity_id_to_row.get(entity_id)
+        if row is not None:
+            return self._entity_emb_matrix[row]
         return self.entity_embeddings.get(entity_id)
-    
-    async def get_relation_embedding(self, relation: str) -> Optional[List[float]]:
+
+    def batch_similarity(self, query_vec) -> np.ndarray:
+        """所有已登记实体嵌入与查询向量的点积，一次GEMV调用"""
+        n = len(self._entity_id_to_row)
+        return self._entity_emb_matrix[:n] @ np.asarray(query_vec,
+                                                        dtype=np.float32)
+
+    def get_relation_embedding(self, relation: str) -> Optional[List[float]]:
         """获取关系嵌入"""
         return self.relation_embeddings.get(relation)
     
@@ -1,92 +1,196 @@
 import json
 import numpy as np
 from typing import Dict, List, Any, Optional
+from collections import deque
 from datetime import datetime, timedelta
 import pickle
 import hashlib
 
+try:
+    from sentence_transformers import SentenceTransformer
+except ImportError:
+    # 编码器可选：缺失时记忆检索回退到Jaccard相似度
+    SentenceTransformer = None
+
+_encoder = None
+
+
+def _get_encoder():
+    """惰性加载句向量编码器，进程内共享一个实例"""
+    global _encoder
+    if _encoder is None and SentenceTransformer is not None:
+        _encoder = SentenceTransformer('all-MiniLM-L6-v2')
+    return _encoder
+
+
 class MemoryStore:
     """记忆存储"""
     
     def __init__(self, storage_type: str = "local"):
         self.storage_type = storage_type
-        self.episodic_memory = []
+        # 有界 deque：写满后 O(1) 淘汰最旧事件，不再切片复制
+        self.episodic_memory = deque(maxlen=1000)
         self.semantic_memory = {}
         self.procedural_memory = {}
+        # 与 episodic_memory 逐行对应的归一化句向量（float32）
+        self._episode_vectors = []
+        # 相似度复用缓冲，容量与事件记忆上限一致
+        self._sim_buf = np.empty(1000, dtype=np.float32)
+        # 语义记忆数值元数据的SoA列：行号与键对齐，
+        # 列布局 [access_count, timestamp_epoch]，衰减可整列向量化
+        self._sem_rows = {}
+        self._sem_meta = np.zeros((16, 2), dtype=np.float64)
         
-    def store_episode(self, episode: Dict[str, Any]):
-        """存储事件记忆"""
-        episode['timestamp'] = datetime.now().isoformat()
-        episode['id'] = self._generate_id(episode)
+    def store_episode(self, episode: Dict[str, Any],
+                      timestamp: Optional[str] = None):
+        """存储事件记忆；timestamp 可由调用方传入以便批量写入复用"""
+        episode['timestamp'] = timestamp or datetime.now().isoformat()
+        # 入库只序列化一次：同一份文本派生内容id、令牌集和句向量
+        content = json.dumps(episode, sort_keys=True, default=str)
+        episode['id'] = self._generate_id(content)
+        episode['_tokens'] = frozenset(content.split())
+
+        # deque 写满后追加会自动淘汰最旧事件，向量列表同步出列
+        if (len(self.episodic_memory) == self.episodic_memory.maxlen
+                and self._episode_vectors):
+            del self._episode_vectors[0]
         self.episodic_memory.append(episode)
-        
-        # 保持记忆大小限制
-        max_size = 1000
-        if len(self.episodic_memory) > max_size:
-            self.episodic_memory = self.episodic_memory[-max_size:]
+
+        # 入库时编码一次，检索阶段只做向量内积
+        encoder = _get_encoder()
+        if encoder is not None:
+            vec = encoder.encode(content, normalize_embeddings=True)
+            self._episode_vectors.append(np.asarray(vec, dtype=np.float32))
     
     def store_semantic(self, key: str, value: Any):
         """存储语义记忆"""
+        now = datetime.now()
         self.semantic_memory[key] = {
             'value': value,
-            'timestamp': datetime.now().isoformat(),
-            'access_count': 0
+            'timestamp': now.isoformat()
         }
+
+        # 数值元数据写入SoA列，容量不足时倍增扩容
+        row = self._sem_rows.get(key)
+        if row is None:
+            row = len(self._sem_rows)
+            if row >= self._sem_meta.shape[0]:
+                grown = np.zeros((self._sem_meta.shape[0] * 2, 2),
+                                 dtype=np.float64)
+                grown[:row] = self._sem_meta[:row]
+                self._sem_meta = grown
+            self._sem_rows[key] = row
+        self._sem_meta[row, 0] = 0.0
+        self._sem_meta[row, 1] = now.timestamp()
     
-    def store_procedural(self, task_type: str, procedure: Dict[str, Any]):
-        """存储程序记忆"""
+    def store_procedural(self, task_type: str, procedure: Dict[str, Any],
+                         timestamp: Optional[str] = None):
+        """存储程序记忆；timestamp 可由调用方传入以便批量写入复用"""
         if task_type not in self.procedural_memory:
             self.procedural_memory[task_type] = []
-        
-        procedure['timestamp'] = datetime.now().isoformat()
+
+        procedure['timestamp'] = timestamp or datetime.now().isoformat()
         procedure['success_rate'] = 0.0
         self.procedural_memory[task_type].append(procedure)
     
-    def retrieve_episodic(self, query: Dict[str, Any], 
-                         limit: int = 10) -> List[Dict[str, Any]]:
-        """检索事件记忆"""
-        # 基于相似度检索
-        similarities = []
-        
-        for episode in self.episodic_memory:
-            similarity = self._calculate_similarity(query, episode)
-            similarities.append((similarity, episode))
-        
-        # 按相似度排序
-        similarities.sort(key=lambda x: x[0], reverse=True)
-        
-        return [episode for _, episode in similarities[:limit]]
+    def retrieve_episodic(self, query: Dict[str, Any],
+                         limit: int = 10,
+                         prefilter=None) -> List[Dict[str, Any]]:
+        """检索事件记忆；prefilter 先做零成本硬匹配剪枝，再算相似度"""
+        episodes = self.episodic_memory
+        if prefilter is not None:
+            candidate_idx = [i for i, episode in enumerate(episodes)
+                             if prefilter(episode)]
+            n = len(candidate_idx)
+        else:
+            candidate_idx = None
+            n = len(episodes)
+        if n == 0:
+            return []
+
+        # 向量路径：一次矩阵-向量乘得到全部相似度
+        encoder = _get_encoder()
+        if encoder is not None and self._episode_vectors:
+            query_vec = np.asarray(
+                encoder.encode(json.dumps(query, sort_keys=True, default=str),
+                               normalize_embeddings=True),
+                dtype=np.float32
+            )
+            if candidate_idx is None:
+                matrix = np.stack(self._episode_vectors)
+            else:
+                matrix = np.stack([self._episode_vectors[i]
+                                   for i in candidate_idx])
+            sims = matrix @ query_vec
+            order = self._top_k_indices(sims, limit)
+            if candidate_idx is not None:
+                return [episodes[candidate_idx[i]] for i in order]
+            return [episodes[i] for i in order]
+
+        # 回退路径：基于Jaccard相似度检索，查询只令牌化一次
+        query_tokens = frozenset(
+            json.dumps(query, sort_keys=True, default=str).split()
+        )
+        sims = self._sim_buf[:n]
+        if candidate_idx is None:
+            for i, episode in enumerate(episodes):
+                sims[i] = self._calculate_similarity(query_tokens, episode)
+            order = self._top_k_indices(sims, limit)
+            return [episodes[i] for i in order]
+
+        for j, i in enumerate(candidate_idx):
+            sims[j] = self._calculate_similarity(query_tokens, episodes[i])
+        order = self._top_k_indices(sims, limit)
+        return [episodes[candidate_idx[j]] for j in order]
+
+    @staticmethod
+    def _top_k_indices(sims: np.ndarray, limit: int) -> np.ndarray:
+        """取相似度最高的 limit 个下标：先 argpartition 分区，再只排序前 K 项"""
+        n = sims.shape[0]
+        if limit < n:
+            idx = np.argpartition(sims, -limit)[-limit:]
+        else:
+            idx = np.arange(n)
+        return idx[np.argsort(-sims[idx])]
     
     def retrieve_semantic(self, key: str) -> Optional[Any]:
         """检索语义记忆"""
-        if key in self.semantic_memory:
-            self.semantic_memory[key]['access_count'] += 1
-            return self.semantic_memory[key]['value']
+        entry = self.semantic_memory.get(key)
+        if entry is not None:
+            self._sem_meta[self._sem_rows[key], 0] += 1
+            return entry['value']
         return None
+
+    def get_access_count(self, key: str) -> float:
+        """读取语义条目的（可能已衰减的）访问计数"""
+        row = self._sem_rows.get(key)
+        return float(self._sem_meta[row, 0]) if row is not None else 0.0
+
+    def apply_decay(self, decay_rate: float):
+        """向量化衰减：全部语义条目的访问计数一次乘法完成"""
+        self._sem_meta[:len(self._sem_rows), 0] *= (1.0 - decay_rate)
     
     def retrieve_procedural(self, task_type: str) -> List[Dict[str, Any]]:
         """检索程序记忆"""
         return self.procedural_memory.get(task_type, [])
     
-    def _generate_id(self, item: Dict[str, Any]) -> str:
-        """生成唯一ID"""
-        content = json.dumps(item, sort_keys=True)
-        return hashlib.md5(content.encode()).hexdigest()
+    def _generate_id(self, content: str) -> str:
+        """由已序列化的内容生成唯一ID"""
+        return hashlib.blake2b(content.encode(), digest_size=16).hexdigest()
     
-    def _calculate_similarity(self, query: Dict[str, Any], 
+    def _calculate_similarity(self, query_tokens: frozenset,
                             episode: Dict[str, Any]) -> float:
         """计算相似度"""
-        # 简化的相似度计算
-        query_str = json.dumps(query)
-        episode_str = json.dumps(episode)
-        
-        # 使用Jaccard相似度
-        query_set = set(query_str.split())
-        episode_set = set(episode_str.split())
-        
-        intersection = len(query_set.intersection(episode_set))
-        union = len(query_set.union(episode_set))
-        
+        # 使用Jaccard相似度；事件令牌集在入库时已预计算
+        episode_tokens = episode.get('_tokens')
+        if episode_tokens is None:
+            episode_tokens = frozenset(
+                json.dumps(episode, sort_keys=True, default=str).split()
+            )
+
+        intersection = len(query_tokens & episode_tokens)
+        union = len(query_tokens | episode_tokens)
+
         return intersection / union if union > 0 else 0.0
 
 class MemorySystem:
@@ -101,8 +205,16 @@ class MemorySystem:
         # 记忆参数
         self.decay_rate = config.get('decay_rate', 0.1)
         self.reinforcement_threshold = config.get('reinforcement_threshold', 3)
+
+        # 相似案例查询门控：同一任务指纹重复查询时直接复用上次结果
+        self._last_case_key = None
+        self._last_case_result = None
     
     async def store_experience(self, task: Dict[str, Any], result: Dict[str, Any]):
+        """存储经验（异步薄封装，内部走同步路径）"""
+        self.store_experience_sync(task, result)
+
+    def store_experience_sync(self, task: Dict[str, Any], result: Dict[str, Any]):
         """存储经验"""
         experience = {
             'task': task,
@@ -110,14 +222,18 @@ class MemorySystem:
             'success': result.get('success', False),
             'confidence': result.get('confidence', 0.0)
         }
-        
+
+        # 同一次经验的多路写入共享一个时间戳，
+        # 免去重复的系统时钟读取和isoformat格式化
+        timestamp = datetime.now().isoformat()
+
         # 存储到短期记忆
-        self.short_term.store_episode(experience)
-        
+        self.short_term.store_episode(experience, timestamp)
+
         # 如果成功且置信度高，存储到长期记忆
         if result.get('success', False) and result.get('confidence', 0) > 0.8:
-            self.long_term.store_episode(experience)
-        
+            self.long_term.store_episode(experience, timestamp)
+
         # 更新程序记忆
         task_type = task.get('task_type', 'unknown')
         procedure = {
@@ -125,47 +241,80 @@ class MemorySystem:
             'success': result.get('success', False),
             'confidence': result.get('confidence', 0.0)
         }
-        self.long_term.store_procedural(task_type, procedure)
+        self.long_term.store_procedural(task_type, procedure, timestamp)
+
+        # 新经验入库后，上次的相似案例结果不再可信
+        self._last_case_key = None
     
-    async def find_similar_cases(self, task: Dict[str, Any], 
+    async def find_similar_cases(self, task: Dict[str, Any],
+                               similarity_threshold: float = 0.7) -> List[Dict[str, Any]]:
+        """查找相似案例（异步薄封装，内部走同步路径）"""
+        return self.find_similar_cases_sync(task, similarity_threshold)
+
+    def find_similar_cases_sync(self, task: Dict[str, Any],
                                similarity_threshold: float = 0.7) -> List[Dict[str, Any]]:
         """查找相似案例"""
+        # 任务指纹未变时跳过全部检索工作
+        fingerprint = (
+            task.get('task_type'),
+            tuple(sorted(map(str, task.get('entities', [])))),
+            similarity_threshold
+        )
+        if fingerprint == self._last_case_key:
+            return self._last_case_result
+
         query = {
             'task_type': task.get('task_type'),
             'entities': task.get('entities', []),
             'relations': task.get('relations', [])
         }
-        
-        # 从长期记忆中检索
-        similar_cases = self.long_term.retrieve_episodic(query)
-        
-        # 过滤相似度
+
+        # 粗排：任务类型硬匹配剪枝后，按廉价相似度召回少量候选
+        task_type = task.get('task_type')
+        similar_cases = self.long_term.retrieve_episodic(
+            query, limit=32,
+            prefilter=lambda e: e.get('task', {}).get('task_type') == task_type
+        )
+
+        # 精排：只对召回的候选做任务相似度过滤；
+        # 查询侧的实体集在循环外只算一次
+        task_entities = set(task.get('entities', []))
         filtered_cases = []
         for case in similar_cases:
-            similarity = self._calculate_task_similarity(task, case['task'])
+            similarity = self._calculate_task_similarity(
+                task_type, task_entities, case['task']
+            )
             if similarity >= similarity_threshold:
                 filtered_cases.append(case)
-        
+
+        self._last_case_key = fingerprint
+        self._last_case_result = filtered_cases
         return filtered_cases
-    
-    def _calculate_task_similarity(self, task1: Dict[str, Any], 
+
+    def _calculate_task_similarity(self, task_type: Optional[str],
+                                 task_entities: set,
                                  task2: Dict[str, Any]) -> float:
         """计算任务相似度"""
         # 基于任务类型、实体和关系的相似度计算
-        type_similarity = 1.0 if task1.get('task_type') == task2.get('task_type') else 0.0
-        
-        entities1 = set(task1.get('entities', []))
-        entities2 = set(task2.get('entities', []))
-        
-        if not entities1 or not entities2:
+        type_similarity = 1.0 if task_type == task2.get('task_type') else 0.0
+
+        entities2 = task2.get('entities', [])
+        if not task_entities or not entities2:
             entity_similarity = 0.0
         else:
-            intersection = len(entities1.intersection(entities2))
-            union = len(entities1.union(entities2))
+            entities2 = set(entities2)
+            # 容斥求并集大小，免去再构造一个union集合
+            intersection = len(task_entities & entities2)
+            union = len(task_entities) + len(entities2) - intersection
             entity_similarity = intersection / union
-        
+
         return (type_similarity + entity_similarity) / 2
     
+    def apply_decay(self):
+        """按配置的衰减率批量衰减两级语义记忆的访问计数"""
+        self.short_term.apply_decay(self.decay_rate)
+        self.long_term.apply_decay(self.decay_rate)
+
     def get_memory_stats(self) -> Dict[str, Any]:
         """获取记忆统计"""
         return {
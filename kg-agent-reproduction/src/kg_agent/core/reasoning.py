@@ -1,7 +1,20 @@
 import asyncio
+import functools
+import hashlib
+import itertools
+import json
 from typing import Dict, List, Any, Optional
-import numpy as np
 from abc import ABC, abstractmethod
+from collections import OrderedDict
+from enum import Enum
+from types import MappingProxyType
+
+class TaskType(Enum):
+    PATH_FINDING = "path_finding"
+    ENTITY_LINKING = "entity_linking"
+    RELATION_PREDICTION = "relation_prediction"
+    COMPLEX_REASONING = "complex_reasoning"
+    QUESTION_ANSWERING = "question_answering"
 
 class ReasoningStrategy(ABC):
     """推理策略基类"""
@@ -29,7 +42,7 @@ class PathFindingStrategy(ReasoningStrategy):
         end_entity = entities[1]
         
         # 使用图算法查找路径
-        paths = await self._find_paths(subgraph, start_entity, end_entity)
+        paths = self._find_paths(subgraph, start_entity, end_entity)
         
         return {
             'paths': paths,
@@ -37,26 +50,40 @@ class PathFindingStrategy(ReasoningStrategy):
             'reasoning_type': 'path_finding'
         }
     
-    async def _find_paths(self, subgraph: Dict[str, Any], 
+    def _find_paths(self, subgraph: Dict[str, Any],
                          start: str, end: str) -> List[List[str]]:
         """查找实体间的路径"""
+        # 占位实现不读子图，缓存键只需端点对；
+        # 接入真实图算法后键应再纳入子图摘要
+        return [list(path) for path in self._find_paths_cached(start, end)]
+
+    @staticmethod
+    @functools.lru_cache(maxsize=1024)
+    def _find_paths_cached(start: str, end: str) -> tuple:
+        """查找实体间的路径（按端点对记忆化，返回不可变元组）"""
         # 简化的路径查找
         # 实际实现应使用图算法如BFS、DFS或A*
-        
+
         # 模拟路径查找
         if start == end:
-            return [[start]]
-        
+            return ((start,),)
+
         # 返回模拟路径
-        return [[start, 'intermediate', end]]
-    
+        return ((start, 'intermediate', end),)
+
     def _calculate_path_confidence(self, paths: List[List[str]]) -> float:
         """计算路径置信度"""
-        if not paths:
+        # 置信度只依赖各路径长度，按长度元组记忆化
+        return self._confidence_from_lengths(tuple(len(path) for path in paths))
+
+    @staticmethod
+    @functools.lru_cache(maxsize=1024)
+    def _confidence_from_lengths(lengths: tuple) -> float:
+        if not lengths:
             return 0.0
-        
+
         # 基于路径长度和质量的置信度计算
-        shortest_path_length = min(len(path) for path in paths)
+        shortest_path_length = min(lengths)
         return max(1.0 - 0.1 * (shortest_path_length - 1), 0.1)
 
 class RelationPredictionStrategy(ReasoningStrategy):
@@ -73,7 +100,7 @@ class RelationPredictionStrategy(ReasoningStrategy):
             return {'relations': [], 'confidence': 0.0}
         
         # 基于知识图谱和历史数据预测关系
-        predictions = await self._predict_relations(entities[0], entities[1], subgraph)
+        predictions = self._predict_relations(entities[0], entities[1], subgraph)
         
         return {
             'predictions': predictions,
@@ -81,7 +108,7 @@ class RelationPredictionStrategy(ReasoningStrategy):
             'reasoning_type': 'relation_prediction'
         }
     
-    async def _predict_relations(self, entity1: str, entity2: str, 
+    def _predict_relations(self, entity1: str, entity2: str,
                                subgraph: Dict[str, Any]) -> List[Dict[str, Any]]:
         """预测实体间关系"""
         # 简化的关系预测
@@ -105,12 +132,12 @@ class ComplexReasoningStrategy(ReasoningStrategy):
         historical_cases = knowledge['historical_cases']
         
         # 多步推理
-        reasoning_steps = await self._multi_step_reasoning(
+        reasoning_steps = self._multi_step_reasoning(
             entities, subgraph, historical_cases
         )
         
         # 综合结果
-        final_result = await self._synthesize_results(reasoning_steps)
+        final_result = self._synthesize_results(reasoning_steps)
         
         return {
             'result': final_result,
@@ -119,57 +146,61 @@ class ComplexReasoningStrategy(ReasoningStrategy):
             'reasoning_type': 'complex_reasoning'
         }
     
-    async def _multi_step_reasoning(self, entities: List[str], 
-                                  subgraph: Dict[str, Any], 
+    def _multi_step_reasoning(self, entities: List[str],
+                                  subgraph: Dict[str, Any],
                                   historical_cases: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         """多步推理过程"""
         steps = []
         
         # 步骤1: 实体理解
-        entity_understanding = await self._understand_entities(entities, subgraph)
+        entity_understanding = self._understand_entities(entities, subgraph)
         steps.append({'step': 1, 'type': 'entity_understanding', 'result': entity_understanding})
         
         # 步骤2: 关系分析
-        relation_analysis = await self._analyze_relations(entities, subgraph)
+        relation_analysis = self._analyze_relations(entities, subgraph)
         steps.append({'step': 2, 'type': 'relation_analysis', 'result': relation_analysis})
         
         # 步骤3: 逻辑推理
-        logical_reasoning = await self._logical_reasoning(entity_understanding, relation_analysis)
+        logical_reasoning = self._logical_reasoning(entity_understanding, relation_analysis)
         steps.append({'step': 3, 'type': 'logical_reasoning', 'result': logical_reasoning})
         
         # 步骤4: 验证和修正
-        validation = await self._validate_reasoning(logical_reasoning, historical_cases)
+        validation = self._validate_reasoning(logical_reasoning, historical_cases)
         steps.append({'step': 4, 'type': 'validation', 'result': validation})
         
         return steps
     
-    async def _understand_entities(self, entities: List[str], 
+    def _understand_entities(self, entities: List[str],
                                  subgraph: Dict[str, Any]) -> Dict[str, Any]:
         """实体理解"""
         entity_info = {}
+        # 实体表在循环外取一次，循环内只做单层查找
+        subgraph_entities = subgraph.get('entities', {})
         for entity in entities:
             entity_info[entity] = {
                 'type': 'entity',
-                'properties': subgraph.get('entities', {}).get(entity, {}),
+                'properties': subgraph_entities.get(entity, {}),
                 'confidence': 0.8
             }
         return entity_info
     
-    async def _analyze_relations(self, entities: List[str], 
+    def _analyze_relations(self, entities: List[str],
                                subgraph: Dict[str, Any]) -> Dict[str, Any]:
         """关系分析"""
         relations = {}
-        for i, entity1 in enumerate(entities):
-            for entity2 in entities[i+1:]:
-                key = f"{entity1}_{entity2}"
-                relations[key] = {
-                    'relation': 'connected',
-                    'strength': 0.7,
-                    'evidence': subgraph.get('relations', {})
-                }
+        if not entities:
+            return relations
+        # 证据只查一次，实体对用combinations代替enumerate+切片
+        evidence = subgraph.get('relations', {})
+        for entity1, entity2 in itertools.combinations(entities, 2):
+            relations[f"{entity1}_{entity2}"] = {
+                'relation': 'connected',
+                'strength': 0.7,
+                'evidence': evidence
+            }
         return relations
     
-    async def _logical_reasoning(self, entity_understanding: Dict[str, Any], 
+    def _logical_reasoning(self, entity_understanding: Dict[str, Any],
                                relation_analysis: Dict[str, Any]) -> Dict[str, Any]:
         """逻辑推理"""
         # 基于实体和关系的逻辑推理
@@ -179,7 +210,7 @@ class ComplexReasoningStrategy(ReasoningStrategy):
             'confidence': 0.75
         }
     
-    async def _validate_reasoning(self, reasoning: Dict[str, Any], 
+    def _validate_reasoning(self, reasoning: Dict[str, Any],
                                 historical_cases: List[Dict[str, Any]]) -> Dict[str, Any]:
         """验证推理"""
         # 基于历史案例验证推理结果
@@ -189,11 +220,12 @@ class ComplexReasoningStrategy(ReasoningStrategy):
             'historical_support': len(historical_cases) > 0
         }
     
-    async def _synthesize_results(self, steps: List[Dict[str, Any]]) -> Dict[str, Any]:
+    def _synthesize_results(self, steps: List[Dict[str, Any]]) -> Dict[str, Any]:
         """综合推理结果"""
-        # 整合所有推理步骤的结果
-        final_confidence = np.mean([step['result'].get('confidence', 0.5) 
-                                  for step in steps])
+        # 整合所有推理步骤的结果；步骤只有4个，直接求和比走NumPy更省
+        final_confidence = sum(
+            step['result'].get('confidence', 0.5) for step in steps
+        ) / len(steps)
         
         return {
             'final_conclusion': 'reasoning_completed',
@@ -206,22 +238,55 @@ class ReasoningEngine:
     
     def __init__(self, config: Dict[str, Any]):
         self.config = config
-        self.strategies = {
+        # 策略表构造后即冻结，避免误改导致字典版本缓存失效
+        self.strategies = MappingProxyType({
             TaskType.PATH_FINDING: PathFindingStrategy(),
             TaskType.RELATION_PREDICTION: RelationPredictionStrategy(),
             TaskType.COMPLEX_REASONING: ComplexReasoningStrategy(),
             TaskType.ENTITY_LINKING: ComplexReasoningStrategy(),
             TaskType.QUESTION_ANSWERING: ComplexReasoningStrategy()
-        }
+        })
+        # 默认策略提前取出，热路径上无需再查一次表
+        self._default_strategy = self.strategies[TaskType.COMPLEX_REASONING]
+        # 推理结果的LRU缓存：键为任务类型+实体+知识摘要，命中时跳过整个策略调用
+        self._reason_cache = OrderedDict()
+        self._reason_cache_max = config.get('reason_cache_size', 128)
     
     async def reason(self, task: Dict[str, Any], 
                     knowledge: Dict[str, Any], 
                     memory: Any) -> Dict[str, Any]:
         """执行推理"""
-        task_type = task['task_type']
-        
-        if task_type not in self.strategies:
-            task_type = TaskType.COMPLEX_REASONING
-        
-        strategy = self.strategies[task_type]
-        return await strategy.reason(task, knowledge, memory)
\ No newline at end of file
+        cache_key = self._cache_key(task, knowledge)
+        if cache_key is not None:
+            cached = self._reason_cache.get(cache_key)
+            if cached is not None:
+                self._reason_cache.move_to_end(cache_key)
+                return cached
+
+        # get 一次探测完成查找，未知类型短路回退到默认策略
+        strategy = self.strategies.get(task['task_type']) or self._default_strategy
+        result = await strategy.reason(task, knowledge, memory)
+
+        if cache_key is not None:
+            if len(self._reason_cache) >= self._reason_cache_max:
+                self._reason_cache.popitem(last=False)
+            self._reason_cache[cache_key] = result
+        return result
+
+    @staticmethod
+    def _cache_key(task: Dict[str, Any],
+                   knowledge: Dict[str, Any]) -> Optional[tuple]:
+        """构造缓存键；知识不可序列化时返回None表示不缓存"""
+        try:
+            subgraph_digest = hashlib.blake2b(
+                json.dumps(knowledge.get('subgraph', {}),
+                           sort_keys=True, default=str).encode(),
+                digest_size=8
+            ).hexdigest()
+            return (
+                task.get('task_type'),
+                tuple(sorted(map(str, task.get('entities', [])))),
+                subgraph_digest
+            )
+        except TypeError:
+            return None
\ No newline at end of file
@@ -1,11 +1,12 @@
 import pytest
+import pytest_asyncio
 import asyncio
 import json
 from kg_agent.core.agent import KGAgent
 from kg_agent.core.memory import MemorySystem
 from kg_agent.core.knowledge import KnowledgeGraphInterface
 
-@pytest.fixture
+@pytest_asyncio.fixture
 async def test_agent():
     """测试智能体fixture"""
     config = {